@@ -1,32 +1,92 @@
-from requests import get
-from bs4 import BeautifulSoup as bs
-import re
-import csv
-import time
+import asyncio
+import uvloop
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import httpx
+from aiolimiter import AsyncLimiter
+from selectolax.lexbor import LexborHTMLParser
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import random
+from stock_data_scraper.dags.scrapers.parsing import (
+    DATA_TABLE_SELECTOR, ROW_SELECTOR, parse_executor, parse_stock_page,
+)
 
-def get_soup(url, max_retries=3):
-    """Get BeautifulSoup object with retry mechanism and proper headers"""
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept-Language': 'en-US,en;q=0.9',
-    }
-    
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+MAX_CONCURRENCY = 10
+REQUESTS_PER_SECOND = 5
+
+# Reuse connections across requests with a pooled session that also retries failed requests
+session = Session()
+session.headers.update(HEADERS)
+session.mount('https://', HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504]),
+))
+
+def get_tree(url):
+    """Get parsed HTML tree, retried with backoff by the session adapter"""
+    try:
+        response = session.get(url, timeout=10)
+        response.raise_for_status()
+    except Exception as e:
+        print(f"Failed to fetch {url}: {e}")
+        raise
+    return LexborHTMLParser(response.text)
+
+async def fetch_page(client, limiter, url, max_retries=3):
+    """Fetch page HTML asynchronously with rate limiting and retry mechanism"""
     for i in range(max_retries):
         try:
-            response = get(url, headers=headers, timeout=10)
+            async with limiter:
+                response = await client.get(url, timeout=15)
             response.raise_for_status()
-            return bs(response.text, features="lxml")
+            return response.text
         except Exception as e:
             if i == max_retries - 1:  # Last attempt
                 print(f"Failed to fetch {url}: {e}")
                 raise
-            print(f"Attempt {i+1} failed. Retrying in 3 seconds...")
-            time.sleep(3)
+            # Back off exponentially with jitter when the server pushes back
+            if isinstance(e, httpx.HTTPStatusError) and e.response.status_code in (429, 503):
+                delay = 2 ** (i + 1) + random.uniform(0, 1)
+            else:
+                delay = 3
+            print(f"Attempt {i+1} for {url} failed. Retrying in {delay:.1f} seconds...")
+            await asyncio.sleep(delay)
+
+async def fetch_with_semaphore(client, semaphore, limiter, url):
+    """Fetch a page while bounding the number of in-flight requests"""
+    async with semaphore:
+        return await fetch_page(client, limiter, url)
+
+async def fetch_and_parse(client, semaphore, limiter, executor, url):
+    """Fetch a page and parse it, in a worker process when given a pool, while other fetches continue"""
+    page = await fetch_with_semaphore(client, semaphore, limiter, url)
+    if executor is None:
+        return parse_stock_page(page)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, parse_stock_page, page)
+
+async def fetch_all(historical_data_links, executor):
+    """Fetch and parse all historical data pages concurrently"""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    limiter = AsyncLimiter(REQUESTS_PER_SECOND, 1)
+    async with httpx.AsyncClient(headers=HEADERS, http2=True, follow_redirects=True) as client:
+        tasks = [
+            fetch_and_parse(client, semaphore, limiter, executor, stock['link'])
+            for stock in historical_data_links
+        ]
+        return await asyncio.gather(*tasks, return_exceptions=True)
 
 def get_stock_link(row, base_url):
     """Fix URL construction to handle relative and absolute URLs properly"""
-    link_element = row.find("a")
-    href = link_element.get('href', '')
+    link_element = row.css_first("a")
+    href = link_element.attributes.get('href') or ''
     
     # Check if the href is a full URL or a relative path
     if href.startswith('http'):
@@ -39,7 +99,7 @@ def get_stock_link(row, base_url):
         # It's a relative URL without starting /
         link = f"{base_url}/{href}-historical-data"
     
-    stock_name = link_element.text.strip()
+    stock_name = link_element.text(strip=True)
     return {
         "stock_name": stock_name,
         "link": link
@@ -48,89 +108,95 @@ def get_stock_link(row, base_url):
 def main():
     base_url = "https://www.investing.com"
     print(f"Fetching main page from {base_url}...")
-    soup = get_soup(base_url)
+    tree = get_tree(base_url)
 
-    regex = re.compile('.*datatable.*')
-    tbody = soup.find("tbody", class_=regex)
+    tbody = tree.css_first(DATA_TABLE_SELECTOR)
     
     if not tbody:
         print("Could not find data table on main page.")
         return
     
-    rows = tbody.find_all("tr")
+    rows = tbody.css(ROW_SELECTOR)
     print(f"Found {len(rows)} rows in the table.")
     
     historical_data_links = [get_stock_link(row, base_url) for row in rows]
     print(f"Identified {len(historical_data_links)} stock links.")
 
-    total_data = []
+    # Cell values are buffered by column position, since header text can repeat
+    columns = []
     headers = []
+    stock_names = []
+    
+    if not historical_data_links:
+        print("No stock links found on main page.")
+        return
+    
+    print(f"Fetching {len(historical_data_links)} historical data pages concurrently...")
+    with parse_executor(len(historical_data_links)) as executor:
+        pages = uvloop.run(fetch_all(historical_data_links, executor))
     
-    for i, stock in enumerate(historical_data_links):
+    for i, (stock, page) in enumerate(zip(historical_data_links, pages)):
         link = stock['link']
         stock_name = stock['stock_name']
-        print(f"Fetching data for {stock_name} ({i+1}/{len(historical_data_links)}): {link}")
+        print(f"Processing data for {stock_name} ({i+1}/{len(historical_data_links)}): {link}")
         
         try:
-            soup = get_soup(link)
-            regex = re.compile('.*freeze-column.*')
-            table = soup.find("table", class_=regex)
+            if isinstance(page, Exception):
+                raise page
             
-            if not table:
+            if page is None:
                 print(f"No table found for {stock_name}. Skipping...")
                 continue
                 
+            if not len(headers) and page['headers']:
+                headers = page['headers']
+                columns = [[] for _ in headers]
+                print(f"Found headers: {headers}")
+            
             if not len(headers):
-                thead = table.find("thead")
-                if thead:
-                    header_cols = thead.find_all("th")
-                    headers = [ele.text.strip() for ele in header_cols]
-                    print(f"Found headers: {headers}")
+                print(f"No headers found yet for {stock_name}. Skipping...")
+                continue
             
-            tbody = table.find("tbody")
-            if not tbody:
+            if page['rows'] is None:
                 print(f"No tbody found for {stock_name}. Skipping...")
                 continue
                 
-            rows = tbody.find_all("tr")
             stock_data_count = 0
             
-            for row in rows:
-                cols = row.find_all("td")
-                cols = [ele.text.strip() for ele in cols]
-                
+            for cols in page['rows']:
                 if len(cols) == len(headers):
-                    data = dict(zip(headers, cols))
-                    data['stock_name'] = stock_name
-                    total_data.append(data)
+                    for column, value in zip(columns, cols):
+                        column.append(value)
+                    stock_names.append(stock_name)
                     stock_data_count += 1
             
             print(f"Fetched {stock_data_count} data points for {stock_name}")
             
-            # Add a small delay to avoid hitting rate limits
-            time.sleep(2)
-            
         except Exception as e:
             print(f"Error processing {stock_name}: {e}")
             continue
-
-    if total_data:
-        write_to_csv(total_data, "stock_data.csv")
-        print(f"Successfully wrote {len(total_data)} records to stock_data.csv")
+    
+    total_records = len(stock_names)
+    if total_records:
+        write_to_csv(name_columns(headers, columns, stock_names), "stock_data.csv")
+        print(f"Successfully wrote {total_records} records to stock_data.csv")
     else:
         print("No data collected. CSV file not written.")
 
-def write_to_csv(data, filename):
-    if not data:
+def name_columns(headers, columns, stock_names):
+    """Map header names to the column buffers, plus the stock name column"""
+    # A repeated header keeps its last column, as dict(zip(headers, cols)) did
+    named = {header: columns[i] for i, header in enumerate(headers)}
+    named['stock_name'] = stock_names
+    return named
+
+def write_to_csv(columns, filename):
+    if not columns:
         print("No data to write.")
         return
         
-    keys = data[0].keys()
-    with open(filename, 'w', newline='', encoding='utf-8') as output_file:
-        dict_writer = csv.DictWriter(output_file, keys)
-        dict_writer.writeheader()
-        dict_writer.writerows(data)
-        print(f"Data written to {filename}")
+    pa_csv.write_csv(pa.table(columns), filename)
+    print(f"Data written to {filename}")
 
 if __name__ == "__main__":
     main()  
\ No newline at end of file
@@ -0,0 +1,47 @@
+import contextlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from selectolax.lexbor import LexborHTMLParser
+
+# CSS selectors for the stock list and historical data tables, reused for every page
+DATA_TABLE_SELECTOR = 'tbody[class*="datatable"]'
+FREEZE_TABLE_SELECTOR = 'table[class*="freeze-column"]'
+ROW_SELECTOR = 'tr'
+
+# A historical data page parses in well under a millisecond, so starting worker
+# processes only pays off for large batches; smaller ones are parsed inline
+PROCESS_POOL_MIN_PAGES = 200
+
+def parse_stock_page(html):
+    """Parse a historical data page into its headers and row cell values"""
+    tree = LexborHTMLParser(html)
+    table = tree.css_first(FREEZE_TABLE_SELECTOR)
+    if not table:
+        return None
+
+    thead = table.css_first("thead")
+    headers = [ele.text(strip=True) for ele in thead.css("th")] if thead else []
+
+    tbody = table.css_first("tbody")
+    if not tbody:
+        return {"headers": headers, "rows": None}
+
+    rows = [
+        [ele.text(strip=True) for ele in row.iter() if ele.tag == "td"]
+        for row in tbody.css(ROW_SELECTOR)
+    ]
+    return {"headers": headers, "rows": rows}
+
+def parse_executor(page_count):
+    """Return a process pool for parsing page_count pages, or a null context to parse them inline"""
+    max_workers = min(page_count, os.cpu_count() or 1)
+    if page_count < PROCESS_POOL_MIN_PAGES or max_workers < 2:
+        return contextlib.nullcontext()
+
+    # Start workers from a fork server instead of forking the caller, which may
+    # already be running threads. The server imports the main script and this
+    # module once, so each worker does not import them again
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(['__main__', __name__])
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
@@ -1,23 +1,78 @@
+import asyncio
+import uvloop
 import requests
-from bs4 import BeautifulSoup as bs
-import re
-import csv
-import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import httpx
+from aiolimiter import AsyncLimiter
+from selectolax.lexbor import LexborHTMLParser
+import random
 import os
+import json
+from functools import lru_cache
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from dotenv import load_dotenv
 from google.cloud import bigquery
 from google.cloud.exceptions import NotFound
+from google.oauth2 import service_account
+from scrapers import parsing
+from scrapers.parsing import parse_executor, parse_stock_page
+from scrapers.transforms import convert_to_float, read_stock_csv
+
+@lru_cache(maxsize=None)
+def get_bigquery_client(project_id):
+    """Return an authenticated BigQuery client shared by every scraper in this process"""
+    service_account_key = os.getenv("GOOGLE_APPLICATION_CREDENTIALS_JSON")
+    if service_account_key:
+        # Build credentials directly from the service account JSON
+        credentials = service_account.Credentials.from_service_account_info(
+            json.loads(service_account_key)
+        )
+        return bigquery.Client(project=project_id, credentials=credentials)
+    
+    # Alternatively, look for path to credentials file
+    key_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+    if not key_path:
+        raise ValueError("No Google Cloud credentials found in environment variables")
+    return bigquery.Client(project=project_id)
 
 class StockDataScraper:
+    # CSS selectors for the stock list and historical data tables, reused for every page
+    DATA_TABLE_SELECTOR = parsing.DATA_TABLE_SELECTOR
+    FREEZE_TABLE_SELECTOR = parsing.FREEZE_TABLE_SELECTOR
+    ROW_SELECTOR = parsing.ROW_SELECTOR
+
+    # Date format used by investing.com historical data, e.g. "Mar 07, 2025"
+    DATE_FORMAT = '%b %d, %Y'
+
+    SCHEMA = [
+        bigquery.SchemaField("stock_name", "STRING", description="Name of the stock"),
+        bigquery.SchemaField("Date", "DATE", description="Date of the stock data"),
+        bigquery.SchemaField("Open", "FLOAT", description="Opening price"),
+        bigquery.SchemaField("High", "FLOAT", description="Highest price"),
+        bigquery.SchemaField("Low", "FLOAT", description="Lowest price"),
+        bigquery.SchemaField("Price", "FLOAT", description="Closing price"),
+        bigquery.SchemaField("Vol", "FLOAT", description="Trading volume"),
+        bigquery.SchemaField("Change", "FLOAT", description="Percentage change")
+    ]
+
     def __init__(self, project_id, dataset_id, table_id):
         self.base_url = "https://www.investing.com"
         self.project_id = project_id
         self.dataset_id = dataset_id
         self.table_id = table_id
         self.headers = []
-        self.total_data = []
+        # Cell values are buffered by column position, since header text can repeat
+        self.columns = []
+        self.stock_names = []
+        self.arrow_table = None
         self.csv_path = "stock_data.csv"
+        self.max_concurrency = 10
+        self.requests_per_second = 5
         
         # Set up headers for requests
         self.request_headers = {
@@ -25,43 +80,79 @@ class StockDataScraper:
             'Accept-Language': 'en-US,en;q=0.9',
         }
         
-        # Initialize BigQuery client
-        self._setup_bigquery_auth()
-        self.client = bigquery.Client(project=self.project_id)
+        # Reuse connections across requests with a pooled session that also retries failed requests
+        self.session = requests.Session()
+        self.session.headers.update(self.request_headers)
+        adapter = HTTPAdapter(
+            pool_connections=20,
+            pool_maxsize=20,
+            max_retries=Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504]),
+        )
+        self.session.mount('https://', adapter)
         
-    def _setup_bigquery_auth(self):
-        """Set up Google Cloud authentication"""
-        service_account_key = os.getenv("GOOGLE_APPLICATION_CREDENTIALS_JSON")
-        if service_account_key:
-            # Write service account JSON to temporary file
-            key_path = "temp_key.json"
-            with open(key_path, 'w') as key_file:
-                key_file.write(service_account_key)
-            os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = key_path
-        else:
-            # Alternatively, look for path to credentials file
-            key_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-            if not key_path:
-                raise ValueError("No Google Cloud credentials found in environment variables")
+        # Initialize BigQuery client
+        self.client = get_bigquery_client(self.project_id)
     
-    def get_soup(self, url, max_retries=3):
-        """Get BeautifulSoup object with retry mechanism"""
+    def get_tree(self, url):
+        """Get parsed HTML tree, retried with backoff by the session adapter"""
+        try:
+            response = self.session.get(url, timeout=10)
+            response.raise_for_status()
+        except Exception as e:
+            print(f"Failed to fetch {url}: {e}")
+            raise
+        return LexborHTMLParser(response.text)
+
+    async def fetch_page(self, client, limiter, url, max_retries=3):
+        """Fetch page HTML asynchronously with rate limiting and retry mechanism"""
         for i in range(max_retries):
             try:
-                response = requests.get(url, headers=self.request_headers, timeout=10)
+                async with limiter:
+                    response = await client.get(url, timeout=15)
                 response.raise_for_status()
-                return bs(response.text, features="lxml")
+                return response.text
             except Exception as e:
                 if i == max_retries - 1:  # Last attempt
                     print(f"Failed to fetch {url}: {e}")
                     raise
-                print(f"Attempt {i+1} failed. Retrying in 3 seconds...")
-                time.sleep(3)
+                # Back off exponentially with jitter when the server pushes back
+                if isinstance(e, httpx.HTTPStatusError) and e.response.status_code in (429, 503):
+                    delay = 2 ** (i + 1) + random.uniform(0, 1)
+                else:
+                    delay = 3
+                print(f"Attempt {i+1} for {url} failed. Retrying in {delay:.1f} seconds...")
+                await asyncio.sleep(delay)
+
+    async def fetch_with_semaphore(self, client, semaphore, limiter, url):
+        """Fetch a page while bounding the number of in-flight requests"""
+        async with semaphore:
+            return await self.fetch_page(client, limiter, url)
+
+    async def fetch_and_parse(self, client, semaphore, limiter, executor, url):
+        """Fetch a page and parse it, in a worker process when given a pool, while other fetches continue"""
+        page = await self.fetch_with_semaphore(client, semaphore, limiter, url)
+        if executor is None:
+            return parse_stock_page(page)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, parse_stock_page, page)
+
+    async def _fetch_all(self, historical_data_links, executor):
+        """Fetch and parse all historical data pages concurrently"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        limiter = AsyncLimiter(self.requests_per_second, 1)
+        async with httpx.AsyncClient(
+            headers=self.request_headers, http2=True, follow_redirects=True
+        ) as client:
+            tasks = [
+                self.fetch_and_parse(client, semaphore, limiter, executor, stock['link'])
+                for stock in historical_data_links
+            ]
+            return await asyncio.gather(*tasks, return_exceptions=True)
 
     def get_stock_link(self, row):
         """Construct stock links with improved URL handling"""
-        link_element = row.find("a")
-        href = link_element.get('href', '')
+        link_element = row.css_first("a")
+        href = link_element.attributes.get('href') or ''
         
         # Check if the href is a full URL or a relative path
         if href.startswith('http'):
@@ -74,7 +165,7 @@ class StockDataScraper:
             # It's a relative URL without starting /
             link = f"{self.base_url}/{href}-historical-data"
         
-        stock_name = link_element.text.strip()
+        stock_name = link_element.text(strip=True)
         return {
             "stock_name": stock_name,
             "link": link
@@ -83,188 +174,155 @@ class StockDataScraper:
     def fetch_data(self):
         """Scrape stock data from investing.com"""
         print(f"Fetching main page from {self.base_url}...")
-        soup = self.get_soup(self.base_url)
+        tree = self.get_tree(self.base_url)
 
-        regex = re.compile('.*datatable.*')
-        tbody = soup.find("tbody", class_=regex)
+        tbody = tree.css_first(self.DATA_TABLE_SELECTOR)
         
         if not tbody:
             print("Could not find data table on main page.")
             return False
         
-        rows = tbody.find_all("tr")
+        rows = tbody.css(self.ROW_SELECTOR)
         print(f"Found {len(rows)} rows in the table.")
         
         historical_data_links = [self.get_stock_link(row) for row in rows]
         print(f"Identified {len(historical_data_links)} stock links.")
         
-        for i, stock in enumerate(historical_data_links):
+        if not historical_data_links:
+            print("No stock links found on main page.")
+            return False
+        
+        print(f"Fetching {len(historical_data_links)} historical data pages concurrently...")
+        with parse_executor(len(historical_data_links)) as executor:
+            pages = uvloop.run(self._fetch_all(historical_data_links, executor))
+        
+        for i, (stock, page) in enumerate(zip(historical_data_links, pages)):
             link = stock['link']
             stock_name = stock['stock_name']
-            print(f"Fetching data for {stock_name} ({i+1}/{len(historical_data_links)}): {link}")
+            print(f"Processing data for {stock_name} ({i+1}/{len(historical_data_links)}): {link}")
             
             try:
-                soup = self.get_soup(link)
-                regex = re.compile('.*freeze-column.*')
-                table = soup.find("table", class_=regex)
+                if isinstance(page, Exception):
+                    raise page
                 
-                if not table:
+                if page is None:
                     print(f"No table found for {stock_name}. Skipping...")
                     continue
                     
+                if not len(self.headers) and page['headers']:
+                    self.headers = page['headers']
+                    self.columns = [[] for _ in self.headers]
+                    print(f"Found headers: {self.headers}")
+                
                 if not len(self.headers):
-                    thead = table.find("thead")
-                    if thead:
-                        header_cols = thead.find_all("th")
-                        self.headers = [ele.text.strip() for ele in header_cols]
-                        print(f"Found headers: {self.headers}")
+                    print(f"No headers found yet for {stock_name}. Skipping...")
+                    continue
                 
-                tbody = table.find("tbody")
-                if not tbody:
+                if page['rows'] is None:
                     print(f"No tbody found for {stock_name}. Skipping...")
                     continue
                     
-                rows = tbody.find_all("tr")
                 stock_data_count = 0
                 
-                for row in rows:
-                    cols = row.find_all("td")
-                    cols = [ele.text.strip() for ele in cols]
-                    
+                for cols in page['rows']:
                     if len(cols) == len(self.headers):
-                        data = dict(zip(self.headers, cols))
-                        data['stock_name'] = stock_name
-                        self.total_data.append(data)
+                        for column, value in zip(self.columns, cols):
+                            column.append(value)
+                        self.stock_names.append(stock_name)
                         stock_data_count += 1
                 
                 print(f"Fetched {stock_data_count} data points for {stock_name}")
                 
-                # Add a small delay to avoid hitting rate limits
-                time.sleep(2)
-                
             except Exception as e:
                 print(f"Error processing {stock_name}: {e}")
                 continue
         
-        if not self.total_data:
+        if not self.record_count():
             print("No data collected.")
             return False
             
-        print(f"Successfully collected {len(self.total_data)} total records")
+        self.arrow_table = self.build_table()
+        print(f"Successfully collected {self.record_count()} total records")
         return True
 
+    def record_count(self):
+        """Number of rows collected in the column buffers"""
+        return len(self.stock_names)
+
+    def build_table(self):
+        """Name the column buffers and build an Arrow table from them"""
+        # A repeated header keeps its last column, as dict(zip(headers, cols)) did
+        columns = {header: self.columns[i] for i, header in enumerate(self.headers)}
+        columns['stock_name'] = self.stock_names
+        return pa.table(columns)
+
     def save_to_csv(self):
         """Save scraped data to CSV file"""
-        if not self.total_data:
+        if self.arrow_table is None:
             print("No data to write to CSV.")
             return False
             
-        keys = self.total_data[0].keys()
-        with open(self.csv_path, 'w', newline='', encoding='utf-8') as output_file:
-            dict_writer = csv.DictWriter(output_file, keys)
-            dict_writer.writeheader()
-            dict_writer.writerows(self.total_data)
-            print(f"Data written to {self.csv_path}")
+        pa_csv.write_csv(self.arrow_table, self.csv_path)
+        print(f"Data written to {self.csv_path}")
         return True
 
     def create_bigquery_dataset_table(self):
-        """Create or get BigQuery dataset and table"""
+        """Create BigQuery dataset if needed and return the table id"""
         dataset_id = f"{self.project_id}.{self.dataset_id}"
         try:
-            dataset = self.client.get_dataset(dataset_id)
+            self.client.get_dataset(dataset_id)
             print(f"Dataset {self.dataset_id} already exists.")
         except NotFound:
             print(f"Dataset {self.dataset_id} not found. Creating now...")
             dataset = bigquery.Dataset(dataset_id)
             dataset.location = "US"
-            dataset = self.client.create_dataset(dataset, timeout=30)
+            self.client.create_dataset(dataset, timeout=30)
             print(f"Dataset {self.dataset_id} created.")
 
-        schema = [
-            bigquery.SchemaField("stock_name", "STRING", description="Name of the stock"),
-            bigquery.SchemaField("Date", "DATE", description="Date of the stock data"),
-            bigquery.SchemaField("Open", "FLOAT", description="Opening price"),
-            bigquery.SchemaField("High", "FLOAT", description="Highest price"),
-            bigquery.SchemaField("Low", "FLOAT", description="Lowest price"),
-            bigquery.SchemaField("Price", "FLOAT", description="Closing price"),
-            bigquery.SchemaField("Vol", "FLOAT", description="Trading volume"),
-            bigquery.SchemaField("Change", "FLOAT", description="Percentage change")
-        ]
-
-        table_id = f"{dataset_id}.{self.table_id}"
-        try:
-            table = self.client.get_table(table_id)
-            print(f"Table {self.table_id} already exists.")
-        except NotFound:
-            print(f"Table {self.table_id} not found. Creating now...")
-            table = bigquery.Table(table_id, schema=schema)
-            table = self.client.create_table(table)
-            print(f"Table {self.table_id} created.")
-        
-        return table_id
-
-    def convert_to_float(self, x):
-        """Convert string values to float with special handling for K, M, B suffixes"""
-        if pd.isna(x) or x == '' or x == 'nan':
-            return None
-        
-        try:
-            x = str(x).strip()
-            if x.endswith('K'):
-                return float(x[:-1]) * 1e3
-            elif x.endswith('M'):
-                return float(x[:-1]) * 1e6
-            elif x.endswith('B'):
-                return float(x[:-1]) * 1e9
-            else:
-                return float(x.replace(',', ''))
-        except (ValueError, TypeError):
-            print(f"Warning: Could not convert '{x}' to float")
-            return None
+        # The load job creates the table from SCHEMA if it does not exist yet
+        return f"{dataset_id}.{self.table_id}"
 
     def process_data(self):
         """Process data for BigQuery upload"""
         # Check if we have data in memory, otherwise load from CSV
-        if not self.total_data and os.path.exists(self.csv_path):
+        if self.arrow_table is not None:
+            # Arrow-backed strings so the transforms below run on the Arrow
+            # buffers without boxing Python str objects
+            data = self.arrow_table.to_pandas(types_mapper=pd.ArrowDtype)
+        elif os.path.exists(self.csv_path):
             print(f"Loading data from {self.csv_path}...")
-            self.total_data = pd.read_csv(self.csv_path).to_dict('records')
-            
-        if not self.total_data:
+            data = read_stock_csv(self.csv_path)
+        else:
             print("No data to process.")
             return False
-            
-        data = pd.DataFrame(self.total_data)
         
         # Process Date column
         if 'Date' in data.columns:
-            data['Date'] = pd.to_datetime(data['Date']).dt.date
+            data['Date'] = pd.to_datetime(data['Date'], format=self.DATE_FORMAT, cache=True)
             print("Date column converted to date format")
         
         # Process numeric columns by removing commas and converting to float
-        numeric_columns = ['Price', 'Open', 'High', 'Low']
-        for col in numeric_columns:
-            if col in data.columns:
-                try:
-                    data[col] = data[col].astype(str).str.replace(',', '').apply(
-                        lambda x: float(x) if x and x != 'nan' else None
-                    )
-                    print(f"Converted {col} to numeric format")
-                except Exception as e:
-                    print(f"Warning: Error processing {col} column: {e}")
+        numeric_columns = [c for c in ['Price', 'Open', 'High', 'Low'] if c in data.columns]
+        data[numeric_columns] = data[numeric_columns].apply(
+            lambda values: pd.to_numeric(
+                values.str.replace(',', '', regex=False), errors='coerce'
+            )
+        )
+        print(f"Converted {', '.join(numeric_columns)} to numeric format")
         
         # Process volume column - handle different naming conventions
         vol_column = next((c for c in data.columns if c in ['Vol', 'Vol.', 'Volume', 'VOL']), None)
         if vol_column:
             data.rename(columns={vol_column: 'Vol'}, inplace=True)
-            data['Vol'] = data['Vol'].astype(str).apply(self.convert_to_float)
+            data['Vol'] = convert_to_float(data['Vol'])
             print(f"Processed volume column '{vol_column}' and renamed to 'Vol'")
         
         # Process Change column
         change_column = next((c for c in data.columns if c in ['Change %', 'Change', '% Change']), None)
         if change_column:
             data.rename(columns={change_column: 'Change'}, inplace=True)
-            data['Change'] = data['Change'].astype(str).str.rstrip('%').apply(
-                lambda x: float(x) if x and x != 'nan' else None
+            data['Change'] = pd.to_numeric(
+                data['Change'].str.rstrip('%'), errors='coerce'
             )
             print("Change column processed")
         
@@ -274,6 +332,19 @@ class StockDataScraper:
         print(data.head(3))
         return True
 
+    def to_parquet_buffer(self):
+        """Serialize processed data to an in-memory Parquet buffer for BigQuery upload"""
+        table = pa.Table.from_pandas(self.processed_data, preserve_index=False)
+        
+        # BigQuery expects a DATE column, so store dates without a time component
+        if 'Date' in table.column_names:
+            date_index = table.column_names.index('Date')
+            table = table.set_column(date_index, 'Date', pc.cast(table['Date'], pa.date32()))
+        
+        sink = pa.BufferOutputStream()
+        pq.write_table(table, sink, compression='snappy')
+        return sink.getvalue()
+
     def load_to_bigquery(self):
         """Load processed data to BigQuery"""
         if not hasattr(self, 'processed_data') or self.processed_data.empty:
@@ -285,29 +356,25 @@ class StockDataScraper:
         
         # Configure the load job
         job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.PARQUET,
+            schema=self.SCHEMA,
             write_disposition="WRITE_TRUNCATE",  # Options: WRITE_TRUNCATE, WRITE_APPEND, WRITE_EMPTY
         )
         
         print(f"\nLoading data to BigQuery table {self.dataset_id}.{self.table_id}...")
-        job = self.client.load_table_from_dataframe(
-            self.processed_data, table_id, job_config=job_config
+        job = self.client.load_table_from_file(
+            pa.BufferReader(self.to_parquet_buffer()), table_id, job_config=job_config
         )
         
         # Wait for the job to complete
         job.result()
         
-        # Get table info and confirm row count
-        table = self.client.get_table(table_id)
-        print(f"Loaded {table.num_rows} rows into {self.dataset_id}.{self.table_id}")
+        # Confirm row count from the finished job
+        print(f"Loaded {job.output_rows} rows into {self.dataset_id}.{self.table_id}")
         
-        # Clean up temp key file if created
-        if os.path.exists("temp_key.json"):
-            os.remove("temp_key.json")
-            print("Temporary credentials file cleaned up")
-            
         return True
 
-    def run_pipeline(self):
+    def run_pipeline(self, save_csv=False):
         """Run the full ETL pipeline"""
         print("Starting stock data ETL pipeline...")
         
@@ -316,8 +383,9 @@ class StockDataScraper:
             print("Data extraction failed. Pipeline stopped.")
             return False
             
-        # Save to CSV (optional intermediate step)
-        self.save_to_csv()
+        # Save to CSV (optional, the pipeline itself keeps data in memory)
+        if save_csv:
+            self.save_to_csv()
         
         # Transform
         if not self.process_data():
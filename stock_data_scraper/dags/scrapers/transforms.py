@@ -0,0 +1,73 @@
+import numba
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Every column of the scraped CSV is kept as an Arrow-backed string and parsed by the
+# transforms, whatever name investing.com gives it (e.g. 'Vol.' or 'Volume')
+CSV_DTYPE = pd.ArrowDtype(pa.string())
+
+def read_stock_csv(path):
+    """Read a scraped stock data CSV into a DataFrame of Arrow-backed string columns"""
+    return pd.read_csv(path, engine='pyarrow', dtype_backend='pyarrow', dtype=CSV_DTYPE)
+
+@numba.njit(cache=True)
+def parse_suffixed(buf, out):
+    """Parse rows of ASCII bytes such as b'1,234.56K' into floats, NaN when invalid"""
+    for i in range(buf.shape[0]):
+        # Fixed-width byte strings are padded with NUL bytes
+        end = buf.shape[1]
+        while end > 0 and buf[i, end - 1] == 0:
+            end -= 1
+
+        multiplier = 1.0
+        if end > 0:
+            suffix = buf[i, end - 1]
+            if suffix == 75:  # 'K'
+                multiplier = 1e3
+                end -= 1
+            elif suffix == 77:  # 'M'
+                multiplier = 1e6
+                end -= 1
+            elif suffix == 66:  # 'B'
+                multiplier = 1e9
+                end -= 1
+
+        start = 0
+        sign = 1.0
+        if end > 0 and (buf[i, 0] == 45 or buf[i, 0] == 43):  # '-' or '+'
+            if buf[i, 0] == 45:
+                sign = -1.0
+            start = 1
+
+        # Accumulate digits as an integer mantissa so the result matches float()
+        mantissa = 0.0
+        decimals = 0
+        digits = 0
+        seen_dot = False
+        valid = True
+        for j in range(start, end):
+            c = buf[i, j]
+            if 48 <= c <= 57:  # '0'-'9'
+                mantissa = mantissa * 10.0 + (c - 48)
+                digits += 1
+                if seen_dot:
+                    decimals += 1
+            elif c == 46 and not seen_dot:  # '.'
+                seen_dot = True
+            elif c != 44:  # anything but ','
+                valid = False
+                break
+
+        if valid and digits > 0:
+            out[i] = sign * mantissa / 10.0 ** decimals * multiplier
+        else:
+            out[i] = np.nan
+
+def convert_to_float(values):
+    """Convert a column of strings to floats with special handling for K, M, B suffixes"""
+    encoded = values.fillna('').str.strip().str.encode('ascii', errors='replace')
+    buf = encoded.to_numpy(dtype=np.bytes_)
+    out = np.empty(len(buf), dtype=np.float64)
+    parse_suffixed(buf.view(np.uint8).reshape(len(buf), buf.dtype.itemsize), out)
+    return pd.Series(out, index=values.index)
@@ -0,0 +1,88 @@
+"""Tests for the volume parsing in scrapers.transforms, checked against the original float()-based conversion."""
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+# The DAGs import the scrapers package from the dags folder, so make it importable here too
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "dags"))
+
+from scrapers.transforms import convert_to_float, parse_suffixed  # noqa: E402
+
+VOLUMES = [
+    "763.44M",
+    "1,234.5K",
+    "-",
+    "",
+    None,
+    "1.2.3",
+    "+0.5B",
+    "12.5K€",
+    "−1.5",
+    "nan",
+    "42",
+    "-3.1B",
+]
+
+
+def float_convert_to_float(x):
+    """
+    The per-value conversion the Numba kernel replaced. Commas are removed up front
+    because the vectorized conversion strips them from every value, suffixed or not.
+    """
+    if pd.isna(x) or x == '' or x == 'nan':
+        return None
+
+    try:
+        x = str(x).strip().replace(',', '')
+        if x.endswith('K'):
+            return float(x[:-1]) * 1e3
+        elif x.endswith('M'):
+            return float(x[:-1]) * 1e6
+        elif x.endswith('B'):
+            return float(x[:-1]) * 1e9
+        else:
+            return float(x)
+    except (ValueError, TypeError):
+        return None
+
+
+def expected_values(values):
+    return np.array(
+        [np.nan if (v := float_convert_to_float(x)) is None else v for x in values],
+        dtype=np.float64,
+    )
+
+
+@pytest.mark.parametrize(
+    "dtype", [object, "string", pd.ArrowDtype(pa.string())], ids=["object", "string", "arrow"]
+)
+def test_convert_to_float_matches_float_conversion(dtype):
+    values = pd.Series(VOLUMES, dtype=dtype)
+    result = convert_to_float(values)
+
+    assert result.dtype == np.float64
+    assert result.index.equals(values.index)
+    np.testing.assert_array_equal(result.to_numpy(), expected_values(VOLUMES))
+
+
+@pytest.mark.parametrize("value", VOLUMES)
+def test_convert_to_float_single_value(value):
+    result = convert_to_float(pd.Series([value], dtype=object))
+    np.testing.assert_array_equal(result.to_numpy(), expected_values([value]))
+
+
+def test_parse_suffixed_ignores_nul_padding():
+    buf = np.array([b"1.5K", b"2M", b""], dtype="S8")
+    out = np.empty(len(buf), dtype=np.float64)
+    parse_suffixed(buf.view(np.uint8).reshape(len(buf), buf.dtype.itemsize), out)
+    np.testing.assert_array_equal(out, [1500.0, 2e6, np.nan])
+
+
+def test_convert_to_float_empty_series():
+    result = convert_to_float(pd.Series([], dtype=object))
+    assert result.empty
+    assert result.dtype == np.float64